@@ -10,6 +10,7 @@ import time
 import json
 import queue
 import torch
+import asyncio
 import httpx
 import logging
 import threading
@@ -42,6 +43,8 @@ app = FastAPI()
 MAX_NEW_TOKENS = 2048
 MAX_RETRIES = 3
 WEBHOOK_TIMEOUT = 120
+MAX_QUEUE_SIZE = 100
+SHUTDOWN_TIMEOUT = 10
 
 MODEL_ID = "mistralai/Mistral-7B-Instruct-v0.2"
 
@@ -49,7 +52,7 @@ MODEL_ID = "mistralai/Mistral-7B-Instruct-v0.2"
 # DATA MODEL
 # ------------------------
 
-@dataclass
+@dataclass(slots=True)
 class ExtractionTask:
     task_id: str
     prompt: str
@@ -176,10 +179,12 @@ class LLMProcessor:
 
 class TaskQueue:
     def __init__(self):
-        self.q = queue.Queue()
+        self.q = queue.Queue(maxsize=MAX_QUEUE_SIZE)
         self.worker = None
         self.stop_event = threading.Event()
         self.processor = LLMProcessor()
+        # one pooled client for all webhooks, keeps connections to callers warm
+        self.client = httpx.Client(timeout=WEBHOOK_TIMEOUT)
 
     def start(self):
         self.worker = threading.Thread(
@@ -191,10 +196,23 @@ class TaskQueue:
 
     def stop(self):
         self.stop_event.set()
-        self.q.put(None)
+        try:
+            self.q.put_nowait(None)
+        except queue.Full:
+            # worker sees stop_event after its current task
+            pass
+
+        # close the client only once the worker is done with it; a generation
+        # still running after the timeout keeps it open until process exit
+        if self.worker is not None:
+            self.worker.join(timeout=SHUTDOWN_TIMEOUT)
+            if self.worker.is_alive():
+                return
+        self.client.close()
 
     def enqueue(self, task: ExtractionTask):
-        self.q.put(task)
+        # raises queue.Full instead of growing without bound
+        self.q.put_nowait(task)
         logger.info(f"Queued {task.task_id}")
 
     def loop(self):
@@ -207,33 +225,37 @@ class TaskQueue:
             self.q.task_done()
 
     def process(self, task: ExtractionTask):
-        try:
-            logger.info(f"Processing {task.task_id}")
+        # retry in place rather than requeueing, so a full queue
+        # never costs a task its remaining attempts
+        while True:
+            try:
+                logger.info(f"Processing {task.task_id}")
 
-            # Extract using provided system prompt and template
-            extraction_result = self.processor.extract(
-                prompt_text=task.prompt,
-                system_prompt=task.system_prompt,
-                template=task.template
-            )
+                # Extract using provided system prompt and template
+                extraction_result = self.processor.extract(
+                    prompt_text=task.prompt,
+                    system_prompt=task.system_prompt,
+                    template=task.template
+                )
 
-            # Always include the result, whether it's valid JSON or raw text
-            payload = {
-                "task_id": task.task_id,
-                "status": "completed",
-                "extracted_data": extraction_result,
-                "metadata": task.metadata
-            }
+                # Always include the result, whether it's valid JSON or raw text
+                payload = {
+                    "task_id": task.task_id,
+                    "status": "completed",
+                    "extracted_data": extraction_result,
+                    "metadata": task.metadata
+                }
+
+                self.send_webhook(task.webhook_url, payload)
+                return
 
-            self.send_webhook(task.webhook_url, payload)
+            except Exception as e:
+                logger.error(f"Task failed: {e}")
 
-        except Exception as e:
-            logger.error(f"Task failed: {e}")
+                if task.retries_left > 0:
+                    task.retries_left -= 1
+                    continue
 
-            if task.retries_left > 0:
-                task.retries_left -= 1
-                self.q.put(task)
-            else:
                 fail = {
                     "task_id": task.task_id,
                     "status": "failed",
@@ -241,14 +263,14 @@ class TaskQueue:
                     "metadata": task.metadata
                 }
                 self.send_webhook(task.webhook_url, fail)
+                return
 
-        finally:
-            torch.cuda.empty_cache()
+            finally:
+                torch.cuda.empty_cache()
 
     def send_webhook(self, url, payload):
         try:
-            with httpx.Client(timeout=WEBHOOK_TIMEOUT) as c:
-                c.post(url, json=payload)
+            self.client.post(url, json=payload)
         except Exception as e:
             logger.error(f"Webhook error: {e}")
 
@@ -279,7 +301,8 @@ async def startup():
 
 @app.on_event("shutdown")
 async def shutdown():
-    task_queue.stop()
+    # stop() joins the worker, keep that off the event loop
+    await asyncio.to_thread(task_queue.stop)
 
 @app.post("/extract")
 async def extract(req: ExtractionRequest):
@@ -299,6 +322,8 @@ async def extract(req: ExtractionRequest):
 
         return {"status": "queued", "task_id": req.task_id}
 
+    except queue.Full:
+        raise HTTPException(503, "Queue is full, retry later")
     except Exception as e:
         raise HTTPException(500, str(e))
 
@@ -306,7 +331,8 @@ async def extract(req: ExtractionRequest):
 async def health():
     return {
         "status": "ok",
-        "queue_size": task_queue.q.qsize()
+        "queue_size": task_queue.q.qsize(),
+        "queue_max": task_queue.q.maxsize
     }
 
 